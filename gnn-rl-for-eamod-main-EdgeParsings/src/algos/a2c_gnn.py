@@ -4,29 +4,39 @@ A2C-GNN
 This file contains the A2C-GNN specifications. In particular, we implement:
 (1) GNNParser
     Converts raw environment observations to agent inputs (s_t).
-(2) GNNActor:
-    Policy parametrized by Graph Convolution Networks (Section III-C in the paper)
-(3) GNNCritic:
-    Critic parametrized by Graph Convolution Networks (Section III-C in the paper)
-(4) A2C:
+(2) GNNTrunk:
+    Graph Convolution Network shared by Actor and Critic (Section III-C in the paper)
+(3) GNNActor:
+    Policy head on top of the GNNTrunk
+(4) GNNCritic:
+    Critic head on top of the GNNTrunk
+(5) A2C:
     Advantage Actor Critic algorithm using a GNN parametrization for both Actor and Critic.
 """
 
-from operator import ne
+import inspect
+
 import numpy as np
 import torch
 from torch import nn
 import torch.nn.functional as F
-from torch.distributions import Dirichlet, Normal, LogNormal, Poisson
-from torch_geometric.data import Data
-from torch_geometric.nn import GCNConv, GATv2Conv
-from torch_geometric.nn import global_mean_pool, global_max_pool
-
+from torch.distributions import Bernoulli
+from torch.distributions.dirichlet import _Dirichlet
+from torch_geometric.data import Batch, Data
+from torch_geometric.nn import GCNConv, global_add_pool
 from torch_geometric.nn import MessagePassing
 from torch.nn import Sequential as Seq, Linear, ReLU
 
 from collections import namedtuple
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional, the parser falls back to NumPy
+    njit = None
+
+# torch.load gained the mmap argument in torch 2.1
+_TORCH_LOAD_HAS_MMAP = 'mmap' in inspect.signature(torch.load).parameters
+
 SavedAction = namedtuple('SavedAction', ['log_prob', 'value'])
 args = namedtuple('args', ('render', 'gamma', 'log_interval'))
 args.render = True
@@ -38,6 +48,27 @@ args.log_interval = 10
 #########################################
 
 
+def _revenue_numpy(price_demand, node_region, feasible):
+    """
+    revenue[n, t] = sum over regions j reachable from node n of price_demand[region of n, j, t].
+    """
+    return np.einsum('njt,nj->nt', price_demand[node_region], feasible)
+
+
+if njit is not None:
+    @njit
+    def _revenue(price_demand, node_region, feasible):
+        # same as _revenue_numpy, without materializing the [N, R, T] gather
+        revenue = np.zeros((node_region.shape[0], price_demand.shape[2]), dtype=price_demand.dtype)
+        for n in range(node_region.shape[0]):
+            for j in range(price_demand.shape[1]):
+                if feasible[n, j]:
+                    revenue[n] += price_demand[node_region[n], j]
+        return revenue
+else:
+    _revenue = _revenue_numpy
+
+
 class GNNParser():
     """
     Parser converting raw environment observations to agent inputs (s_t).
@@ -52,151 +83,132 @@ class GNNParser():
         self.input_size = 2 + (2 * T) # features in first two tensors = 2, features in last two tensors = 2 * T
         self.isMPNN = MPNN
 
-    def parse_obs(self, version=0, charge_delta=0, max_charge=0, MPNN=False):
-        # nodes
+        # static node tables (the graph does not change within an env), indexed by position in env.nodes / env.region;
+        # features are kept in float32 throughout so the tensors handed to torch need no conversion copy
+        self._region_idx = {r: i for i, r in enumerate(self.env.region)}
+        self._node_region = np.array([self._region_idx[n[0]] for n in self.env.nodes], dtype=np.int64)
+        self._node_charge_level = np.array([n[1] for n in self.env.nodes], dtype=np.int64)
+        self._node_charge = (self._node_charge_level / self.env.scenario.number_charge_levels).astype(np.float32)
+        self._energy_distance = np.array([[self.env.scenario.energy_distance[i, j] for j in self.env.region] for i in self.env.region], dtype=np.float32)
+        no_station = np.array([int(not self.env.scenario.charging_stations[j]) for j in self.env.region])
+        # feasible[n, j]: a vehicle at node n can reach region j with the charge it has left
+        self._feasible = (self._node_charge_level[:, None] - self._energy_distance[self._node_region]) >= no_station[None, :]
+        self._node_to_idx = {n: i for i, n in enumerate(self.env.nodes)}
+        # is_env_edge[o, d]: (o, d) is an edge of the AMoD graph
+        self._is_env_edge = np.zeros((len(self.env.nodes), len(self.env.nodes)), dtype=bool)
+        for o, d in self.env.edges:
+            self._is_env_edge[self._node_to_idx[o], self._node_to_idx[d]] = True
+        self._edge_index_cache = {}
+
+    def _od_window(self, table, t0):
+        """
+        Gathers a region x region table (price, demand) over the next T time steps into an array of shape [R, R, T].
+        """
+        return np.array([[[table[i, j][t] for t in range(t0, t0 + self.T)] for j in self.env.region] for i in self.env.region], dtype=np.float32)
 
-        # print(torch.tensor([float(n[1])/self.env.scenario.number_charge_levels for n in self.env.nodes]
-        #                  ).view(1, 1, self.env.number_nodes).float().shape)
-        # print(torch.tensor([self.env.acc[n][self.env.time+1]*self.scale_factor for n in self.env.nodes]
-        #                  ).view(1, 1, self.env.number_nodes).float().shape)
-        # print(torch.tensor([[(self.env.acc[n][self.env.time+1] + self.env.dacc[n][t])*self.scale_factor for n in self.env.nodes]
-        #                   for t in range(self.env.time+1, self.env.time+self.T+1)]).view(1, self.T, self.env.number_nodes).float().shape)
-        # print(torch.tensor([[sum([self.env.price[o[0], j][t]*self.scale_factor*self.price_scale_factor*(self.env.demand[o[0], j][t])*((o[1]-self.env.scenario.energy_distance[o[0], j]) >= int(not self.env.scenario.charging_stations[j]))
-        #                   for j in self.env.region]) for o in self.env.nodes] for t in range(self.env.time+1, self.env.time+self.T+1)]).view(1, self.T, self.env.number_nodes).float().shape)        
-        x = torch.cat((
-            torch.tensor([float(n[1])/self.env.scenario.number_charge_levels for n in self.env.nodes]
-                         ).view(1, 1, self.env.number_nodes).float(),
-            torch.tensor([self.env.acc[n][self.env.time+1]*self.scale_factor for n in self.env.nodes]
-                         ).view(1, 1, self.env.number_nodes).float(),
-            torch.tensor([[(self.env.acc[n][self.env.time+1] + self.env.dacc[n][t])*self.scale_factor for n in self.env.nodes]
-                          for t in range(self.env.time+1, self.env.time+self.T+1)]).view(1, self.T, self.env.number_nodes).float(),
-            torch.tensor([[sum([self.env.price[o[0], j][t]*self.scale_factor*self.price_scale_factor*(self.env.demand[o[0], j][t])*((o[1]-self.env.scenario.energy_distance[o[0], j]) >= int(not self.env.scenario.charging_stations[j]))
-                          for j in self.env.region]) for o in self.env.nodes] for t in range(self.env.time+1, self.env.time+self.T+1)]).view(1, self.T, self.env.number_nodes).float()),
-                      dim=1).squeeze(0).view(1 + 1 + self.T + self.T, self.env.number_nodes).T
-        # edges 
+    def _to_edge_index(self, *masks):
+        """
+        Converts boolean [N, N] masks over (origin, destination) node pairs into a [2, E] edge_index tensor.
+        A pair gets one edge per mask it satisfies, ordered as nested loops over env.nodes would produce them.
+        """
+        counts = sum(mask.astype(np.int64) for mask in masks)
+        origins, destinations = np.nonzero(counts)
+        repeats = counts[origins, destinations]
+        return torch.from_numpy(np.stack((origins.repeat(repeats), destinations.repeat(repeats)))).long()
+
+    def _build_edge_index(self, version, charge_delta, max_charge):
+        """
+        Builds the edge_index passed to the GNN for a given version of the graph.
+        """
+        if version not in range(7):
+            raise ValueError(f"Unknown edge_index version: {version}")
+
+        # pairwise relations between origin (rows) and destination (columns) nodes
+        same_region = self._node_region[:, None] == self._node_region[None, :]
+        o_charge = self._node_charge_level[:, None]
+        d_charge = self._node_charge_level[None, :]
+        self_loops = same_region & (o_charge == d_charge)
 
         # versions for edge_index
-        
+
         if version == 0:
         # V0 - all edges from AMoD passed into GCN
-            edges = self.env.edges
             edge_index = self.env.gcn_edge_idx
-            # print("# of EDGES PASSED TO GCN" + str(edge_index.shape[1]))
-        
+
         if version == 1:
         # V1 - no edges, only self loops
-            edges = []
-            for o in self.env.nodes:
-                for d in self.env.nodes:
-                    if (o[0] == d[0] and o[1] == d[1]):
-                        edges.append([o, d])
-            edge_idx = torch.tensor([[], []], dtype=torch.long)
-            for e in edges:
-                origin_node_idx = self.env.nodes.index(e[0])
-                destination_node_idx = self.env.nodes.index(e[1])
-                new_edge = torch.tensor([[origin_node_idx], [destination_node_idx]], dtype=torch.long)
-                edge_idx = torch.cat((edge_idx, new_edge), 1)
-            edge_index = edge_idx
-            # print("# of EDGES PASSED TO GCN" + str(edge_index.shape[1])) # = 12
-        
+            edge_index = self._to_edge_index(self_loops)
+
         if version == 2:
         # V2 - combination of V0 and V1
-            edges = []
-            for o in self.env.nodes:
-                for d in self.env.nodes:
-                    if (o[0] == d[0] and o[1] == d[1]):
-                        edges.append([o, d])
-            edge_idx = torch.tensor([[], []], dtype=torch.long)
-            for e in edges:
-                origin_node_idx = self.env.nodes.index(e[0])
-                destination_node_idx = self.env.nodes.index(e[1])
-                new_edge = torch.tensor([[origin_node_idx], [destination_node_idx]], dtype=torch.long)
-                edge_idx = torch.cat((edge_idx, new_edge), 1)
+            edge_idx = self._to_edge_index(self_loops)
             edge_index = torch.cat((edge_idx, self.env.gcn_edge_idx), 1)
-            # print("# of EDGES PASSED TO GCN" + str(edge_index.shape[1])) # = 32
-        
+
         if version == 3:
         # V3 - grid style one-hop connections
-            edges = []
-            for o in self.env.nodes:
-                for d in self.env.nodes:
-                    if ((o[1] == d[1] and o[0] != d[0]) or ((o[1] == d[1] - 1) and (o[0] == d[0])) or ((o[1] == d[1] + 1) and (o[0] == d[0]))):
-                        edges.append([o, d])
-            edge_idx = torch.tensor([[], []], dtype=torch.long)
-            for e in edges:
-                origin_node_idx = self.env.nodes.index(e[0])
-                destination_node_idx = self.env.nodes.index(e[1])
-                new_edge = torch.tensor([[origin_node_idx], [destination_node_idx]], dtype=torch.long)
-                edge_idx = torch.cat((edge_idx, new_edge), 1)
-            edge_index = edge_idx
-            # print("# of EDGES PASSED TO GCN" + str(edge_index.shape[1])) # = 32
-        
+            edge_index = self._to_edge_index(
+                ((o_charge == d_charge) & ~same_region) | ((o_charge == d_charge - 1) & same_region) | ((o_charge == d_charge + 1) & same_region))
+
         if version == 4:
         # V4 - combination of V3 and V1
-            edges = []
-            for o in self.env.nodes:
-                for d in self.env.nodes:
-                    if ((o[1] == d[1] and o[0] == d[0]) or (o[1] == d[1] and o[0] != d[0]) or ((o[1] == d[1] - 1) and (o[0] == d[0])) or ((o[1] == d[1] + 1) and (o[0] == d[0]))):
-                        edges.append([o, d])
-            edge_idx = torch.tensor([[], []], dtype=torch.long)
-            for e in edges:
-                origin_node_idx = self.env.nodes.index(e[0])
-                destination_node_idx = self.env.nodes.index(e[1])
-                new_edge = torch.tensor([[origin_node_idx], [destination_node_idx]], dtype=torch.long)
-                edge_idx = torch.cat((edge_idx, new_edge), 1)
-            edge_index = edge_idx
-            # print("# of EDGES PASSED TO GCN" + str(edge_index.shape[1])) # = 44
-        
+            edge_index = self._to_edge_index(
+                self_loops | ((o_charge == d_charge) & ~same_region) | ((o_charge == d_charge - 1) & same_region) | ((o_charge == d_charge + 1) & same_region))
+
+        if version in (5, 6):
+            # artificial edges
+            artificial = ~same_region & (o_charge + (charge_delta - 1) == d_charge) & (d_charge != max_charge)
+            # "infeasible" charge edges
+            infeasible_charge = same_region & (o_charge + (charge_delta + 1) == d_charge)
+            # "unintuitive" road edges
+            unintuitive_road = same_region & (o_charge - 1 == d_charge)
+
         if version == 5:
         # V5 - all edges + artificial edges + "infeasible" charge edges + "unintuitive" road edges + self loops
-            edges = []
-            for o in self.env.nodes:
-                for d in self.env.nodes:
-                    # artificial edges
-                    if ((o[0] != d[0]) and (o[1] + (charge_delta - 1) == d[1]) and (d[1] != max_charge)):
-                        edges.append([o, d])
-                    # "infeasible" charge edges
-                    if ((o[0] == d[0]) and (o[1] + (charge_delta + 1) == d[1])):
-                        edges.append([o, d])
-                    # "unintuitive" road edges
-                    if (o[0] == d[0] and (o[1] - 1 == d[1])):
-                        edges.append([o, d])
-                    # self loops
-                    if (o[0] == d[0] and o[1] == d[1]):
-                        edges.append([o, d])
-            edge_idx = torch.tensor([[], []], dtype=torch.long)
-            for e in edges:
-                origin_node_idx = self.env.nodes.index(e[0])
-                destination_node_idx = self.env.nodes.index(e[1])
-                new_edge = torch.tensor([[origin_node_idx], [destination_node_idx]], dtype=torch.long)
-                edge_idx = torch.cat((edge_idx, new_edge), 1)
-            edge_idx = torch.cat((edge_idx, self.env.gcn_edge_idx), 1)
-            edge_index = edge_idx
-            # print("# of EDGES PASSED TO GCN" + str(edge_index.shape[1]))
+            edge_idx = self._to_edge_index(artificial, infeasible_charge, unintuitive_road, self_loops)
+            edge_index = torch.cat((edge_idx, self.env.gcn_edge_idx), 1)
 
         if version == 6:
         # V6 - all edges + artificial edges + "infeasible" charge edges + "unintuitive" road edges
-            edges = []
-            for o in self.env.nodes:
-                for d in self.env.nodes:
-                    # artificial edges
-                    if ((o[0] != d[0]) and (o[1] + (charge_delta - 1) == d[1]) and (d[1] != max_charge)):
-                        edges.append([o, d])
-                    # "infeasible" charge edges
-                    if ((o[0] == d[0]) and (o[1] + (charge_delta + 1) == d[1])):
-                        edges.append([o, d])
-                    # "unintuitive" road edges
-                    if (o[0] == d[0] and (o[1] - 1 == d[1])):
-                        edges.append([o, d])
-            edge_idx = torch.tensor([[], []], dtype=torch.long)
-            for e in edges:
-                origin_node_idx = self.env.nodes.index(e[0])
-                destination_node_idx = self.env.nodes.index(e[1])
-                new_edge = torch.tensor([[origin_node_idx], [destination_node_idx]], dtype=torch.long)
-                edge_idx = torch.cat((edge_idx, new_edge), 1)
-            edge_idx = torch.cat((edge_idx, self.env.gcn_edge_idx), 1)
-            edge_index = edge_idx
-            # print("# of EDGES PASSED TO GCN" + str(edge_index.shape[1])) # = 36
+            edge_idx = self._to_edge_index(artificial, infeasible_charge, unintuitive_road)
+            edge_index = torch.cat((edge_idx, self.env.gcn_edge_idx), 1)
+
+        return edge_index
+
+    def _edge_attr(self, edge_index, price, demand):
+        """
+        Edge features [demand | price | energy distance] over the next T time steps, as an [E, 3T] tensor.
+        Edges that exist in the AMoD graph get the values between their regions, all others are zero.
+        """
+        src, dst = edge_index.numpy()
+        is_env_edge = self._is_env_edge[src, dst][:, None]
+        o_region, d_region = self._node_region[src], self._node_region[dst]
+        demand_for_e_t = np.where(is_env_edge, demand[o_region, d_region], 0.)
+        price_for_e_t = np.where(is_env_edge, price[o_region, d_region], 0.)
+        energy_distance_e_t = np.where(is_env_edge, self._energy_distance[o_region, d_region][:, None], 0.).repeat(self.T, axis=1)
+        edge_attr = np.concatenate((demand_for_e_t, price_for_e_t, energy_distance_e_t), axis=1)
+        return torch.from_numpy(edge_attr)
+
+    def parse_obs(self, version=0, charge_delta=0, max_charge=0, MPNN=False):
+        # nodes
+        t0 = self.env.time + 1
+        acc = np.array([self.env.acc[n][t0] for n in self.env.nodes], dtype=np.float32)
+        dacc = np.array([[self.env.dacc[n][t] for t in range(t0, t0 + self.T)] for n in self.env.nodes], dtype=np.float32)
+        price = self._od_window(self.env.price, t0)
+        demand = self._od_window(self.env.demand, t0)
+        price_demand = price * demand
+        # sum over reachable destination regions j of price * demand, for every node and time step
+        revenue = _revenue(price_demand, self._node_region, self._feasible)
+        x = torch.from_numpy(np.concatenate((
+            self._node_charge[:, None],
+            acc[:, None] * self.scale_factor,
+            (acc[:, None] + dacc) * self.scale_factor,
+            revenue * self.scale_factor * self.price_scale_factor),
+            axis=1))
+        # edges (topology only depends on the version and the env graph, so it is built once and cached)
+        key = (version, charge_delta, max_charge)
+        if key not in self._edge_index_cache:
+            self._edge_index_cache[key] = self._build_edge_index(version, charge_delta, max_charge)
+        edge_index = self._edge_index_cache[key]
 
         # default/global return (regular GCN)
         if not MPNN: 
@@ -208,34 +220,7 @@ class GNNParser():
         # potential edge features = 
         # number of vehicles travelling on given edge at a given time, price of rebalancing, demand
         
-            edge_attr = []
-            # edges.extend(self.env.edges) # needed when adding self-loops only
-            for idx in range(edge_index.shape[1]):
-                e = [self.env.nodes[edge_index[0, idx]], self.env.nodes[edge_index[1, idx]]]
-
-                if e in self.env.edges:
-                    i, j = self.env.edges[self.env.edges.index(e)]
-
-                    demand_for_e_t = list(self.env.demand[i, j][t] for t in range(self.env.time+1, self.env.time+self.T+1))
-                    price_for_e_t  = list(self.env.price[i, j][t] for t in range(self.env.time+1, self.env.time+self.T+1))
-                    energy_distance_e_t = [self.env.scenario.energy_distance[i, j]] * self.T
-
-                else:
-                    demand_for_e_t = [0] * self.T
-                    price_for_e_t = [0] * self.T
-                    energy_distance_e_t = [0] * self.T
-                
-                while len(demand_for_e_t) < self.T or len(price_for_e_t) < self.T or len(energy_distance_e_t) < self.T:
-                    demand_for_e_t.append(0)
-                    price_for_e_t.append(0)
-                    energy_distance_e_t.append(0)
-                
-                q = [demand_for_e_t + price_for_e_t + energy_distance_e_t]
-                edge_attr.append(q)
-        
-            # Convert the list of edge attributes into a tensor
-            tensor = torch.tensor(edge_attr)
-            e = (tensor.view(1, np.prod(tensor.shape)).float()).squeeze(0).view(self.T * 3, edge_index.shape[1]).T
+            e = self._edge_attr(edge_index, price, demand)
 
             # print("x shape: " + str(x.shape))
             # print("edge_index shape: " + str(edge_index.shape)) 
@@ -265,35 +250,9 @@ class GNNParser():
                           for j in self.env.region]) for o in self.env.region] for t in range(self.env.time+1, self.env.time+self.T+1)]).view(1, self.T, self.env.number_nodes_spatial).float()),
               dim=1).squeeze(0).view(1 + self.T + self.T, self.env.number_nodes_spatial).T
         edge_index  = self.env.gcn_edge_idx_spatial
+        t0 = self.env.time + 1
+        e = self._edge_attr(edge_index, self._od_window(self.env.price, t0), self._od_window(self.env.demand, t0))
 
-        edge_attr = []
-        for idx in range(edge_index.shape[1]):
-            e = [self.env.nodes[edge_index[0, idx]], self.env.nodes[edge_index[1, idx]]]
-
-            if e in self.env.edges:
-                i, j = self.env.edges[self.env.edges.index(e)]
-
-                demand_for_e_t = list(self.env.demand[i, j][t] for t in range(self.env.time+1, self.env.time+self.T+1))
-                price_for_e_t  = list(self.env.price[i, j][t] for t in range(self.env.time+1, self.env.time+self.T+1))
-                energy_distance_e_t = [self.env.scenario.energy_distance[i, j]] * self.T
-
-            else:
-                demand_for_e_t = [0] * self.T
-                price_for_e_t = [0] * self.T
-                energy_distance_e_t = [0] * self.T
-            
-            while len(demand_for_e_t) < self.T or len(price_for_e_t) < self.T or len(energy_distance_e_t) < self.T:
-                demand_for_e_t.append(0)
-                price_for_e_t.append(0)
-                energy_distance_e_t.append(0)
-            
-            q = [demand_for_e_t + price_for_e_t + energy_distance_e_t]
-            edge_attr.append(q)
-    
-        # Convert the list of edge attributes into a tensor
-        tensor = torch.tensor(edge_attr)
-        e = (tensor.view(1, np.prod(tensor.shape)).float()).squeeze(0).view(self.T * 3, edge_index.shape[1]).T
-        
         data = Data(x, edge_index, edge_attr=e)
         return data
 
@@ -310,52 +269,46 @@ class EdgeConv(MessagePassing):
         # edge_index: edge indices of shape [2, num_edges]
         # edge_attr has shape [E, in_channels]
 
-        return self.propagate(edge_index, x=x, edge_attr=edge_attr) # shape = [num_nodes, out_channels]
+        # the first layer of the mlp is linear in [x_i, x_j, edge_attr], so its weight is split into one block per input:
+        # node features are projected once per node instead of once per edge, and the [E, in_channels] concatenation is never built
+        n_node_features = x.size(1)
+        weight = self.mlp[0].weight
+        x_i_proj = F.linear(x, weight[:, :n_node_features])
+        x_j_proj = F.linear(x, weight[:, n_node_features:2 * n_node_features])
+        edge_attr_proj = F.linear(edge_attr, weight[:, 2 * n_node_features:], self.mlp[0].bias)
 
-    def message(self, x_i, x_j, edge_attr):
-        # x_i has shape [E, in_channels] - source node features
-        # x_j has shape [E, in_channels] - target node features
-        # edge_attr has shape [E, in_channels]
-
-        # print("x_i shape: " + str(x_i.shape))
-        # print("x_j shape: " + str(x_j.shape))
-        # print("edge_attr shape: " + str(edge_attr.shape))
+        return self.propagate(edge_index, x_i_proj=x_i_proj, x_j_proj=x_j_proj, edge_attr=edge_attr_proj) # shape = [num_nodes, out_channels]
 
-        tmp = torch.cat([x_i, x_j, edge_attr], dim=1)  
-        # print("tmp shape: " + str(tmp.shape))
+    def message(self, x_i_proj_i, x_j_proj_j, edge_attr):
+        # x_i_proj_i has shape [E, out_channels] - projected source node features
+        # x_j_proj_j has shape [E, out_channels] - projected target node features
+        # edge_attr has shape [E, out_channels] - projected edge features (incl. bias)
 
-        return self.mlp(tmp)
+        return self.mlp[2](self.mlp[1](x_i_proj_i + x_j_proj_j + edge_attr))
 
 #########################################
-############## ACTOR ####################
+############## TRUNK ####################
 #########################################
 
 
-class GNNActor(nn.Module):
+class GNNTrunk(nn.Module):
     """
-    Actor \pi(a_t | s_t) parametrizing the concentration parameters of a Dirichlet Policy.
+    Graph convolution stack shared by the actor and the critic, computing node embeddings from s_t.
     """
 
     # MPNN implementation
     def __init__(self, in_channels, hidden_channels, T=10):
-        super(GNNActor, self).__init__()
+        super(GNNTrunk, self).__init__()
 
-        self.conv1 = GCNConv(in_channels, hidden_channels)
+        # the graph is fixed for a given env, so the GCN normalisation is computed once and cached
+        # (A2C.on_env_change flushes it when the graph changes)
+        self.conv1 = GCNConv(in_channels, hidden_channels, cached=True)
 
         # in_channels = 2 * in_channels_from_nodes + 3 * in_channels_from_edges
         self.econv1 = EdgeConv((in_channels * 2) + (T * 3), hidden_channels)
         
-        self.conv2 = GCNConv(hidden_channels * 2, hidden_channels)  # second convolution layer
-        self.conv3 = GCNConv(hidden_channels, in_channels) # third convolution layer
-        
-        self.lin1 = nn.Linear(in_channels * 2, in_channels)
-        self.lin2 = nn.Linear(in_channels, 128)
-        self.lin3 = nn.Linear(128, 32)
-        self.lin4 = nn.Linear(32, 2)
-
-        # self.h_to_mu = nn.Linear(22 + hidden_dim, out_channels)
-        # self.h_to_sigma = nn.Linear(22 + hidden_dim, out_channels)
-        # self.h_to_concentration = nn.Linear(22 + hidden_dim, out_channels)
+        self.conv2 = GCNConv(hidden_channels * 2, hidden_channels, cached=True)  # second convolution layer
+        self.conv3 = GCNConv(hidden_channels, in_channels, cached=True) # third convolution layer
 
     def forward(self, data):
 
@@ -367,7 +320,32 @@ class GNNActor(nn.Module):
         out_2 = F.softplus(self.conv2(out_1c, data.edge_index))
         out_3 = F.softplus(self.conv3(out_2, data.edge_index))
 
-        out_3c = torch.cat([data.x, out_3], dim=1)
+        return torch.cat([data.x, out_3], dim=1)
+
+#########################################
+############## ACTOR ####################
+#########################################
+
+
+class GNNActor(nn.Module):
+    """
+    Actor \pi(a_t | s_t) parametrizing the concentration parameters of a Dirichlet Policy.
+    Operates on the node embeddings of the GNNTrunk.
+    """
+
+    def __init__(self, in_channels):
+        super(GNNActor, self).__init__()
+        
+        self.lin1 = nn.Linear(in_channels * 2, in_channels)
+        self.lin2 = nn.Linear(in_channels, 128)
+        self.lin3 = nn.Linear(128, 32)
+        self.lin4 = nn.Linear(32, 2)
+
+        # self.h_to_mu = nn.Linear(22 + hidden_dim, out_channels)
+        # self.h_to_sigma = nn.Linear(22 + hidden_dim, out_channels)
+        # self.h_to_concentration = nn.Linear(22 + hidden_dim, out_channels)
+
+    def forward(self, out_3c):
 
         x = F.softplus(self.lin1(out_3c))
         x = F.softplus(self.lin2(x))
@@ -390,37 +368,24 @@ class GNNActor(nn.Module):
 class GNNCritic(nn.Module):
     """
     Critic parametrizing the value function estimator V(s_t).
+    Operates on the node embeddings of the GNNTrunk.
     """
 
-    # MPNN implementation
-    def __init__(self, in_channels, hidden_channels, T=10):
+    def __init__(self, in_channels):
         super(GNNCritic, self).__init__()
-
-        self.conv1 = GCNConv(in_channels, hidden_channels)
-
-        # in_channels = 2 * in_channels_from_nodes + 3 * in_channels_from_edges
-        self.econv1 = EdgeConv((in_channels * 2) + (T * 3), hidden_channels)
-        
-        self.conv2 = GCNConv(hidden_channels * 2, hidden_channels)  # second convolution layer
-        self.conv3 = GCNConv(hidden_channels, in_channels) # third convolution layer
         
         self.lin1 = nn.Linear(in_channels * 2, in_channels)
         self.lin2 = nn.Linear(in_channels, 128)
         self.lin3 = nn.Linear(128, 32)
         self.lin4 = nn.Linear(32, 1)
 
-    def forward(self, data):
-
-        out_1 = F.softplus(self.conv1(data.x, data.edge_index))
-        out_e1 = F.softplus(self.econv1(data.x, data.edge_index, data.edge_attr))
+    def forward(self, out_3c, batch=None):
 
-        out_1c = torch.cat([out_1, out_e1], dim=1)
-        
-        out_2 = F.softplus(self.conv2(out_1c, data.edge_index))
-        out_3 = F.softplus(self.conv3(out_2, data.edge_index))
-
-        out_3c = torch.cat([data.x, out_3], dim=1)
-        out_3c = torch.sum(out_3c, dim=0)
+        # sum over the nodes of each graph (batch assigns nodes to graphs when several are batched together)
+        if batch is None:
+            out_3c = torch.sum(out_3c, dim=0)
+        else:
+            out_3c = global_add_pool(out_3c, batch)
 
         x = F.softplus(self.lin1(out_3c))
         x = F.softplus(self.lin2(x))
@@ -436,9 +401,15 @@ class GNNCritic(nn.Module):
 class A2C(nn.Module):
     """
     Advantage Actor Critic algorithm for the AMoD control problem. 
+
+    The actor and critic heads share one GNNTrunk. The actor optimizer (lr_a, grad_norm_clip_a) owns the trunk and
+    the actor head, the critic optimizer (lr_c, grad_norm_clip_c) owns only the critic head. The critic therefore
+    shapes the shared layers only through the value-loss gradient reaching the trunk, which is scaled by
+    value_loss_coef and then stepped and clipped together with the policy gradient under lr_a / grad_norm_clip_a.
+    Checkpoints written before the trunk was shared do not load (actor.conv* / critic.conv* became trunk.conv*).
     """
 
-    def __init__(self, env, eps=np.finfo(np.float32).eps.item(), device=torch.device("cpu"), T=10, lr_a=1.e-3, lr_c=1.e-3, grad_norm_clip_a=0.5, grad_norm_clip_c=0.5, seed=10, scale_factor=0.01, scale_price=0.1):
+    def __init__(self, env, eps=np.finfo(np.float32).eps.item(), device=torch.device("cpu"), T=10, lr_a=1.e-3, lr_c=1.e-3, grad_norm_clip_a=0.5, grad_norm_clip_c=0.5, seed=10, scale_factor=0.01, scale_price=0.1, compile_model=False, inference_dtype=None, value_loss_coef=0.5):
         super(A2C, self).__init__()
         self.env = env
         self.eps = eps
@@ -449,32 +420,65 @@ class A2C(nn.Module):
         self.adapted_lr_c = lr_c
         self.grad_norm_clip_a = grad_norm_clip_a
         self.grad_norm_clip_c = grad_norm_clip_c
+        # weight of the value loss in the gradient of the shared trunk (the critic head always sees the full loss)
+        self.value_loss_coef = value_loss_coef
         self.scale_factor = scale_factor
         self.scale_price = scale_price
+        # optional reduced precision (e.g. torch.bfloat16) for the eval_mode forward in select_action
+        self.inference_dtype = inference_dtype
         self.input_size = 2 + (2 * T) # features in first two tensors = 2, features in last two tensors = 2 * T
 
         torch.manual_seed(seed)
-        self.device = device
-
-        # MPNN implementation
-        self.actor = GNNActor(in_channels=self.input_size, hidden_channels=self.input_size, T=T)
-        self.critic = GNNCritic(in_channels=self.input_size, hidden_channels=self.input_size, T=T)
+        self.device = torch.device(device)
+
+        # MPNN implementation, actor and critic heads share one graph convolution trunk
+        self.trunk = GNNTrunk(in_channels=self.input_size, hidden_channels=self.input_size, T=T)
+        self.actor = GNNActor(in_channels=self.input_size)
+        self.critic = GNNCritic(in_channels=self.input_size)
+        if compile_model:
+            # input shapes are fixed for a given env (edge_index is cached per version), so each module compiles once per env;
+            # compiling the bound forward keeps the state_dict keys unchanged.
+            # The default mode is used on purpose: reduce-overhead replays CUDA graphs whose outputs live in static
+            # buffers overwritten by the next replay, while every step's outputs (and the activations saved for
+            # backward) must stay alive in saved_actions until training_step
+            for module in (self.trunk, self.actor, self.critic):
+                module.forward = torch.compile(module.forward, dynamic=False)
         self.obs_parser = GNNParser(self.env, T=T, input_size=self.input_size, scale_factor=scale_factor, scale_price=scale_price, MPNN=True)
 
+        # parameters are moved before the optimizers are built, as the fused Adam kernel needs them on the device
+        self.to(self.device)
         self.optimizers = self.configure_optimizers()
 
         # action & reward buffer
         self.saved_actions = []
         self.rewards = []
-        self.means_concentration = []
-        self.std_concentration = []
-        self.to(self.device)
+        # running [sum of means, sum of stds, count] of the non-zero concentrations since the env was set
+        self.concentration_stats = torch.zeros(3, device=self.device)
+        # gamma^k, k = 0, 1, ..., for the discounted returns; grown on demand in training_step
+        self._gamma_powers = torch.ones(0, dtype=torch.float64, device=self.device)
 
     def set_env(self, env):
         self.env = env
         self.obs_parser = GNNParser(self.env, T=self.T, input_size=self.input_size, scale_factor=self.scale_factor, scale_price=self.scale_price)
-        self.means_concentration = []
-        self.std_concentration = []
+        self.concentration_stats = torch.zeros(3, device=self.device)
+        self.on_env_change()
+
+    def on_env_change(self):
+        """
+        drop the GCN normalisation cached for the previous graph
+        """
+        for module in self.modules():
+            if isinstance(module, GCNConv):
+                module._cached_edge_index = None
+                module._cached_adj_t = None
+
+    def _critic_input(self, h):
+        """
+        identity on the trunk embeddings whose backward scales the value-loss gradient reaching the trunk by value_loss_coef
+        """
+        if self.value_loss_coef == 1:
+            return h
+        return h * self.value_loss_coef + h.detach() * (1 - self.value_loss_coef)
 
     def decay_learning_rate(self, scaler_a=1, scaler_c=1):
         self.adapted_lr_a *= scaler_a
@@ -486,23 +490,48 @@ class A2C(nn.Module):
         forward of both actor and critic
         """
         # parse raw environment data in model format
-        x = self.parse_obs(version=5, charge_delta=self.env.scenario.charge_levels_per_charge_step, max_charge=self.env.scenario.number_charge_levels, MPNN=True).to(self.device)
+        x = self.parse_obs(version=5, charge_delta=self.env.scenario.charge_levels_per_charge_step, max_charge=self.env.scenario.number_charge_levels, MPNN=True)
+        # single host-to-device copy shared by actor and critic, asynchronous from page-locked memory
+        if self.device.type == 'cuda':
+            x = x.pin_memory()
+        x = x.to(self.device, non_blocking=True)
 
         # MPNN implementation
+        h = self.trunk(x)
 
         # actor: computes concentration parameters of a X distribution
-        a_out_concentration, a_out_is_zero = self.actor(x)
-
-        a_out_concentration = a_out_concentration.to(self.device)
-        a_out_is_zero = a_out_is_zero.to(self.device)
+        a_out_concentration, a_out_is_zero = self.actor(h)
 
         concentration = F.softplus(a_out_concentration).reshape(-1) + jitter
         non_zero = torch.sigmoid(a_out_is_zero).reshape(-1)
         
         # critic: estimates V(s_t)
-        value = self.critic(x)
+        value = self.critic(self._critic_input(h))
         return concentration, non_zero, value
 
+    def forward_batch(self, data_list, jitter=1e-20):
+        """
+        forward of both actor and critic on several parsed observations at once (e.g. from parallel envs):
+        the graphs are batched into one block-diagonal graph, so the trunk runs a single time for all of them
+        """
+        batch = Batch.from_data_list(data_list)
+        # the batched graph differs from the single-env graph the GCN cache was built for
+        self.on_env_change()
+        if self.device.type == 'cuda':
+            batch = batch.pin_memory()
+        batch = batch.to(self.device, non_blocking=True)
+
+        h = self.trunk(batch)
+        a_out_concentration, a_out_is_zero = self.actor(h)
+        concentration = F.softplus(a_out_concentration).reshape(-1) + jitter
+        non_zero = torch.sigmoid(a_out_is_zero).reshape(-1)
+        value = self.critic(self._critic_input(h), batch.batch)
+        self.on_env_change()
+
+        # split the node-level outputs back per observation
+        sizes = [data.num_nodes for data in data_list]
+        return concentration.split(sizes), non_zero.split(sizes), value
+
     def parse_obs(self, version, charge_delta, max_charge, MPNN, spatial=False):
 
         if spatial:
@@ -513,209 +542,104 @@ class A2C(nn.Module):
         return state
 
     def select_action(self, eval_mode=False):
-        concentration, non_zero, value = self.forward()
-        
-        concentration = concentration.to(self.device)
-        non_zero = non_zero.to(self.device)
-        value = value.to(self.device)
-        
-        # concentration, value = self.forward(obs)
-        
-        concentration_without_zeros = torch.tensor([], dtype=torch.float32).to(self.device)
-        sampled_zero_bool_arr = []
-        log_prob_for_zeros = 0
-        for node in range(non_zero.shape[0]):
-            sample = torch.bernoulli(non_zero[node])
-            if sample > 0:
-                indices = torch.tensor([node]).to(self.device)
-                new_element = torch.index_select(concentration, 0, indices)
-                concentration_without_zeros = torch.cat((concentration_without_zeros, new_element), 0)
-                sampled_zero_bool_arr.append(False)
-                log_prob_for_zeros += torch.log(non_zero[node])
-            else:
-                sampled_zero_bool_arr.append(True)
-                log_prob_for_zeros += torch.log(1-non_zero[node])
+        if eval_mode and self.inference_dtype is not None:
+            # the networks run under autocast, sampling and log-probabilities stay in float32
+            with torch.autocast(device_type=self.device.type, dtype=self.inference_dtype):
+                concentration, non_zero, value = self.forward()
+            concentration, non_zero, value = concentration.float(), non_zero.float(), value.float()
+        else:
+            concentration, non_zero, value = self.forward()
+
+        # sample which nodes get a non-zero share of the vehicles, all nodes in one pass;
+        # Bernoulli.log_prob works on clamped logits, so it stays finite when non_zero saturates at 0 or 1
+        zero_dist = Bernoulli(probs=non_zero, validate_args=False)
+        sample = zero_dist.sample()
+        log_prob_for_zeros = zero_dist.log_prob(sample).sum()
+        sampled = sample.bool()
+        concentration_without_zeros = concentration[sampled]
+        action = torch.zeros_like(concentration)
         if concentration_without_zeros.shape[0] != 0:
-            mean_concentration = np.mean(concentration_without_zeros.detach().numpy())
-            std_concentration = np.std(concentration_without_zeros.detach().numpy())
-            self.means_concentration.append(mean_concentration)
-            self.std_concentration.append(std_concentration)
-            m = Dirichlet(concentration_without_zeros)
+            # accumulated in place on the device, only reduced to numbers in training_step
+            alpha_stats = concentration_without_zeros.detach()
+            self.concentration_stats += torch.stack([alpha_stats.mean(), alpha_stats.std(correction=0), alpha_stats.new_ones(())])
+            # sample and score the Dirichlet directly instead of building a distribution object every step;
+            # _Dirichlet.apply is what Dirichlet.rsample uses, so the reparameterised gradient is kept
+            alpha = concentration_without_zeros
             if (eval_mode):
-                dirichlet_action = concentration_without_zeros / (concentration_without_zeros.sum() + 1e-16)
+                dirichlet_action = alpha / (alpha.sum() + 1e-16)
             else:
-                dirichlet_action = m.rsample()
-            dirichlet_action_np = list(dirichlet_action.detach().numpy())
-            log_prob_dirichlet = m.log_prob(dirichlet_action)
+                dirichlet_action = _Dirichlet.apply(alpha)
+            action[sampled] = dirichlet_action.detach()
+            log_prob_dirichlet = (torch.xlogy(alpha - 1.0, dirichlet_action).sum()
+                                  + torch.lgamma(alpha.sum()) - torch.lgamma(alpha).sum())
         else:
             log_prob_dirichlet = 0
         self.saved_actions.append(SavedAction(log_prob_dirichlet+log_prob_for_zeros, value))
-        action_np = []
-        dirichlet_idx = 0
-        for node in range(non_zero.shape[0]):
-            if sampled_zero_bool_arr[node]:
-                action_np.append(0.)
-            else:
-                action_np.append(dirichlet_action_np[dirichlet_idx])
-                dirichlet_idx += 1
-        return action_np
+        return action.cpu().tolist()
 
     def select_equal_action(self):
         n_nodes = len(self.env.nodes)
         action = np.ones(n_nodes)/n_nodes
         return list(action)
     
-    def select_action_MPNN(self, eval_mode=False):
-        concentration, non_zero, value = self.forward()
-        
-        concentration = concentration.to(self.device)
-        non_zero = non_zero.to(self.device)
-        value = value.to(self.device)
-
-        # print(concentration.shape)
-        # print(non_zero.shape)
-        # print(value.shape)
-
-        # concentration, value = self.forward(obs)
-        concentration_without_zeros = torch.tensor([], dtype=torch.float32).to(self.device)
-        sampled_zero_bool_arr = []
-        log_prob_for_zeros = 0
-        for node in range(non_zero.shape[0]):
-            sample = torch.bernoulli(non_zero[node]).to(self.device)
-            if sample > 0:
-                indices = torch.tensor([node]).to(self.device)
-                new_element = torch.index_select(concentration, 0, indices).to(self.device)
-                concentration_without_zeros = torch.cat((concentration_without_zeros, new_element), 0)
-                sampled_zero_bool_arr.append(False)
-                log_prob_for_zeros += torch.log(non_zero[node]).to(self.device)
-            else:
-                sampled_zero_bool_arr.append(True)
-                log_prob_for_zeros += torch.log(1-non_zero[node]).to(self.device)
-        if concentration_without_zeros.shape[0] != 0:
-            mean_concentration = np.mean(concentration_without_zeros.cpu().detach().numpy())
-            std_concentration = np.std(concentration_without_zeros.cpu().detach().numpy())
-            self.means_concentration.append(mean_concentration)
-            self.std_concentration.append(std_concentration)
-            m = Dirichlet(concentration_without_zeros)
-            if (eval_mode):
-                dirichlet_action = concentration_without_zeros / (concentration_without_zeros.sum() + 1e-16)
-            else:
-                dirichlet_action = m.rsample()
-            dirichlet_action_np = list(dirichlet_action.cpu().detach().numpy())
-            log_prob_dirichlet = m.log_prob(dirichlet_action)
-        else:
-            log_prob_dirichlet = 0
-        self.saved_actions.append(SavedAction(log_prob_dirichlet+log_prob_for_zeros, value))
-        action_np = []
-        dirichlet_idx = 0
-        for node in range(non_zero.shape[0]):
-            if sampled_zero_bool_arr[node]:
-                action_np.append(0.)
-            else:
-                action_np.append(dirichlet_action_np[dirichlet_idx])
-                dirichlet_idx += 1
-        
-        return action_np
-    
-    def select_action_GAT(self, eval_mode=False):
-        concentration, non_zero, value = self.forward()
-        concentration = concentration.to(self.device)
-        non_zero = non_zero.to(self.device)
-        value = value.to(self.device)
-        # concentration, value = self.forward(obs)
-        concentration_without_zeros = torch.tensor([], dtype=torch.float32)
-        sampled_zero_bool_arr = []
-        log_prob_for_zeros = 0
-        for node in range(non_zero.shape[0]):
-            sample = torch.bernoulli(non_zero[node])
-            if sample > 0:
-                indices = torch.tensor([node])
-                new_element = torch.index_select(concentration, 0, indices)
-                concentration_without_zeros = torch.cat((concentration_without_zeros, new_element), 0)
-                sampled_zero_bool_arr.append(False)
-                log_prob_for_zeros += torch.log(non_zero[node])
-            else:
-                sampled_zero_bool_arr.append(True)
-                log_prob_for_zeros += torch.log(1-non_zero[node])
-        if concentration_without_zeros.shape[0] != 0:
-            mean_concentration = np.mean(concentration_without_zeros.detach().numpy())
-            std_concentration = np.std(concentration_without_zeros.detach().numpy())
-            self.means_concentration.append(mean_concentration)
-            self.std_concentration.append(std_concentration)
-            m = Dirichlet(concentration_without_zeros)
-            if (eval_mode):
-                dirichlet_action = concentration_without_zeros / (concentration_without_zeros.sum() + 1e-16)
-            else:
-                dirichlet_action = m.rsample()
-            dirichlet_action_np = list(dirichlet_action.detach().numpy())
-            log_prob_dirichlet = m.log_prob(dirichlet_action)
-        else:
-            log_prob_dirichlet = 0
-        self.saved_actions.append(SavedAction(log_prob_dirichlet+log_prob_for_zeros, value))
-        action_np = []
-        dirichlet_idx = 0
-        for node in range(non_zero.shape[0]):
-            if sampled_zero_bool_arr[node]:
-                action_np.append(0.)
-            else:
-                action_np.append(dirichlet_action_np[dirichlet_idx])
-                dirichlet_idx += 1
-        return action_np
+    # the MPNN and GAT entry points sample actions exactly like select_action
+    select_action_MPNN = select_action
+    select_action_GAT = select_action
 
     def training_step(self):
-        R = 0
         saved_actions = self.saved_actions
-        policy_losses = []  # list to save actor (policy) loss
-        value_losses = []  # list to save critic (value) loss
-        returns = []  # list to save the true values
 
-        # calculate the true value using rewards returned from the environment
-        for r in self.rewards[::-1]:
-            # calculate the discounted value
-            R = r + args.gamma * R
-            returns.insert(0, R)
+        # calculate the true value using rewards returned from the environment:
+        # R_i = sum_{k >= i} gamma^(k - i) r_k, as a reversed cumulative sum of gamma^k r_k rescaled by gamma^-i
+        # (in float64, gamma^k underflows float32 precision on long episodes)
+        # one host-to-device copy of the episode rewards, asynchronous from page-locked memory
+        rewards = torch.tensor(self.rewards, dtype=torch.float64)
+        if self.device.type == 'cuda':
+            rewards = rewards.pin_memory()
+        rewards = rewards.to(self.device, non_blocking=True)
+        if self._gamma_powers.numel() < len(self.rewards):
+            self._gamma_powers = args.gamma ** torch.arange(len(self.rewards), dtype=torch.float64, device=self.device)
+        discounts = self._gamma_powers[:len(self.rewards)]
+        returns = (rewards * discounts).flip(0).cumsum(0).flip(0) / discounts
 
         # returns = [r / 4390. for r in returns] # 49000 is the maximum reward
-        returns = torch.tensor(returns)
-        returns = (returns - returns.mean()) / (returns.std() + self.eps)
-
-        log_probs = []
-        values = []
-        for (log_prob, value) in saved_actions:
-            log_probs.append(log_prob.item())
-            values.append(value.item())
-
-        mean_value = np.mean(values)
-        mean_concentration = np.mean(self.means_concentration)
-        mean_std = np.mean(self.std_concentration)
-        mean_log_prob = np.mean(log_probs)
-        std_log_prob = np.std(log_probs)
-        for (log_prob, value), R in zip(saved_actions, returns):
-            # normed_log_prob = (log_prob - np.mean(log_probs)) / (np.std(log_probs) + self.eps)
-            # normed_value = (value - mean_value) / (np.std(values) + self.eps)
-            advantage = R - value.item()
-
-            # calculate actor (policy) loss
-            policy_losses.append(-log_prob * advantage)
-
-            # calculate critic (value) loss using L1 smooth loss
-            value_losses.append(F.smooth_l1_loss(value, torch.tensor([R]).to(self.device)))
+        returns = ((returns - returns.mean()) / (returns.std() + self.eps)).float()
+
+        log_probs = torch.stack([log_prob for (log_prob, value) in saved_actions])
+        values = torch.stack([value for (log_prob, value) in saved_actions]).view(-1)
+
+        mean_value = values.mean().item()
+        sum_mean, sum_std, count = self.concentration_stats.tolist()
+        mean_concentration = sum_mean / count if count else np.nan
+        mean_std = sum_std / count if count else np.nan
+        mean_log_prob = log_probs.mean().item()
+        std_log_prob = log_probs.std(correction=0).item()
+
+        # normed_log_prob = (log_probs - log_probs.mean()) / (log_probs.std() + self.eps)
+        # normed_value = (values - values.mean()) / (values.std() + self.eps)
+        advantage = returns - values.detach()
+
+        # calculate actor (policy) loss
+        a_loss = -(log_probs * advantage).sum()
+        # calculate critic (value) loss using L1 smooth loss, summed over the episode
+        v_loss = F.smooth_l1_loss(values, returns, reduction='sum')
 
         # take gradient steps
-        self.optimizers['a_optimizer'].zero_grad()
-        a_loss = torch.stack(policy_losses).sum()
-        a_loss = torch.clamp(a_loss, -1000, 1000)
+        self.optimizers['a_optimizer'].zero_grad(set_to_none=True)
+        self.optimizers['c_optimizer'].zero_grad(set_to_none=True)
+        # saturate the actor loss at +-1000: a saturated loss is replaced by a constant (no gradient),
+        # otherwise the loss passes through untouched
+        a_loss = torch.where(a_loss.abs() > 1000, a_loss.detach().sign() * 1000, a_loss)
         # if np.abs(a_loss.item()) == 1000:
         #     self.decay_learning_rate(scaler_a=0.1)
-        a_loss.backward()
-        torch.nn.utils.clip_grad_norm_(self.actor.parameters(), self.grad_norm_clip_a)
-        self.optimizers['a_optimizer'].step()
-
-        self.optimizers['c_optimizer'].zero_grad()
-        v_loss = torch.stack(value_losses).sum()
         # v_loss = torch.clamp(v_loss, -1000, 1000)
-        v_loss.backward()
-        torch.nn.utils.clip_grad_norm_(self.critic.parameters(), self.grad_norm_clip_c)
+        # both losses flow through the shared trunk, so they are backpropagated together; the critic head gets the
+        # full value-loss gradient, the trunk value_loss_coef times it (see _critic_input)
+        (a_loss + v_loss).backward()
+        # multi-tensor norm and rescale of the gradients, then the multi-tensor Adam update
+        torch.nn.utils.clip_grad_norm_(self.actor_parameters(), self.grad_norm_clip_a, foreach=True)
+        self.optimizers['a_optimizer'].step()
+        torch.nn.utils.clip_grad_norm_(self.critic.parameters(), self.grad_norm_clip_c, foreach=True)
         self.optimizers['c_optimizer'].step()
 
         # reset rewards and action buffer
@@ -723,16 +647,33 @@ class A2C(nn.Module):
         del self.saved_actions[:]
         return a_loss, v_loss, mean_value, mean_concentration, mean_std, mean_log_prob, std_log_prob
 
+    def actor_parameters(self):
+        """
+        Parameters updated by the actor optimizer: the shared trunk and the actor head.
+        """
+        return list(self.trunk.parameters()) + list(self.actor.parameters())
+
     def configure_optimizers(self):
         optimizers = dict()
-        actor_params = list(self.actor.parameters())
+        actor_params = self.actor_parameters()
         critic_params = list(self.critic.parameters())
-        optimizers['a_optimizer'] = torch.optim.Adam(actor_params, lr=self.adapted_lr_a)
+        optimizers['a_optimizer'] = self._adam(actor_params, lr=self.adapted_lr_a)
         # optimizers['a_optimizer'] = torch.optim.RAdam(actor_params, lr=self.adapted_lr_a)
-        optimizers['c_optimizer'] = torch.optim.Adam(critic_params, lr=self.adapted_lr_c)
+        optimizers['c_optimizer'] = self._adam(critic_params, lr=self.adapted_lr_c)
         # optimizers['c_optimizer'] = torch.optim.RAdam(critic_params, lr=self.adapted_lr_c)
         return optimizers
 
+    def _adam(self, params, lr):
+        """
+        Adam with the multi-tensor update: the fused kernel on CUDA, the foreach implementation otherwise
+        """
+        try:
+            if self.device.type == 'cuda':
+                return torch.optim.Adam(params, lr=lr, fused=True)
+            return torch.optim.Adam(params, lr=lr, foreach=True)
+        except TypeError:  # torch versions without the fused/foreach arguments
+            return torch.optim.Adam(params, lr=lr)
+
     def save_checkpoint(self, path='ckpt.pth'):
         checkpoint = dict()
         checkpoint['model'] = self.state_dict()
@@ -741,7 +682,11 @@ class A2C(nn.Module):
         torch.save(checkpoint, path)
 
     def load_checkpoint(self, path='ckpt.pth'):
-        checkpoint = torch.load(path)
+        # tensors are mapped straight onto the model's device, from the memory-mapped file where torch supports it
+        if _TORCH_LOAD_HAS_MMAP:
+            checkpoint = torch.load(path, map_location=self.device, weights_only=True, mmap=True)
+        else:
+            checkpoint = torch.load(path, map_location=self.device, weights_only=True)
         self.load_state_dict(checkpoint['model'])
         for key, value in self.optimizers.items():
             self.optimizers[key].load_state_dict(checkpoint[key])
@@ -1,6 +1,6 @@
 # Class def for optimization
 import gurobipy as gp
-from gurobipy import quicksum
+import numpy as np
 
 class PaxFlowsSolver:
 
@@ -44,18 +44,26 @@ class PaxFlowsSolver:
         self.m.setObjective(obj, gp.GRB.MAXIMIZE)
 
     def update_constraints(self):
+        t = self.env.time
+        acc = self.env.acc
+        demand = self.env.demand
+        cons_spatial_graph = self.cons_spatial_graph
         for n in self.env.nodes:
-            self.cons_charge_graph[n].RHS = float(
-                self.env.acc[n][self.env.time])
+            self.cons_charge_graph[n].RHS = float(acc[n][t])
         for i in self.env.region:
             for j in self.env.region:
-                self.cons_spatial_graph[(
-                    i, j)].RHS = self.env.demand[i, j][self.env.time]
+                cons_spatial_graph[(i, j)].RHS = demand[i, j][t]
         self.m.update()
 
     def update_objective(self):
-        obj = quicksum(self.flow[i] * (self.env.price[self.env.edges[i][0][0], self.env.edges[i][1][0]][self.env.time] - (self.env.G.edges[self.env.edges[i]]
-                  ['time'][self.env.time]+self.env.scenario.time_normalizer) * self.env.scenario.operational_cost_per_timestep) for i in range(len(self.env.edges)))
+        t = self.env.time
+        price = self.env.price
+        graph_edges = self.env.G.edges
+        time_normalizer = self.env.scenario.time_normalizer
+        cost_per_timestep = self.env.scenario.operational_cost_per_timestep
+        profit = np.array([price[edge[0][0], edge[1][0]][t] - (graph_edges[edge]['time'][t] + time_normalizer) * cost_per_timestep
+                           for edge in self.env.edges])
+        obj = self.flow @ profit
         self.m.setObjective(obj, gp.GRB.MAXIMIZE)
         self.m.update()
 
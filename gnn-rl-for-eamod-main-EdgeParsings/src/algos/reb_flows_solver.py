@@ -1,8 +1,14 @@
 # Class def for optimization
 import gurobipy as gp
+import numpy as np
 from gurobipy import quicksum
 
 
+def _as_constr(constr):
+    # constraints built from MVar expressions come back as 0-d MConstr, Model.setAttr wants the scalar Constr
+    return constr.item() if isinstance(constr, gp.MConstr) else constr
+
+
 class RebalFlowSolver:  
     def __init__(self, env, desiredAcc, gurobi_env):
         # Initialize model
@@ -11,9 +17,14 @@ class RebalFlowSolver:
         self.cons_spatial_graph_charging_cars = {}
         t = env.time
         self.m = gp.Model(env=gurobi_env)
+        # the model is a pure LP (|slack| is split into two nonnegative parts below, not an abs general constraint,
+        # which would make it a MIP), built once and re-solved after update_constraints/update_objective: each solve
+        # warm-starts from the previous basis, and dual simplex re-optimises fastest after RHS changes
+        self.m.Params.Method = 1
         self.flow = self.m.addMVar(shape=(len(env.edges)), lb=0, ub=gp.GRB.INFINITY, vtype=gp.GRB.CONTINUOUS, name="flow") # both could be INTEGER
-        self.slack_variables = self.m.addMVar(shape=(len(env.nodes)), lb=-10000000, ub=gp.GRB.INFINITY, vtype=gp.GRB.CONTINUOUS, name="slack")
-        self.slack_variables_abs = self.m.addMVar(shape=(len(env.nodes)), lb=0, ub=gp.GRB.INFINITY, vtype=gp.GRB.CONTINUOUS, name="slack_abs")
+        # slack = slack_pos - slack_neg, penalising slack_pos + slack_neg equals penalising |slack| at the optimum
+        self.slack_pos = self.m.addMVar(shape=(len(env.nodes)), lb=0, ub=gp.GRB.INFINITY, vtype=gp.GRB.CONTINUOUS, name="slack_pos")
+        self.slack_neg = self.m.addMVar(shape=(len(env.nodes)), lb=0, ub=10000000, vtype=gp.GRB.CONTINUOUS, name="slack_neg")
 
         for n_idx in range(len(env.nodes)):
             n = env.nodes[n_idx]
@@ -24,8 +35,7 @@ class RebalFlowSolver:
             self.cons_charge_graph1[n_idx] = self.m.addConstr(sum(self.flow[outgoing_edges]) <= env.acc[n][t + 1])
 
             # Constraint 2: We want to reach the target distribrution
-            self.cons_charge_graph2[n_idx] = self.m.addConstr(sum(self.flow[incoming_edges]) - sum(self.flow[outgoing_edges]) + self.slack_variables[n_idx] == desiredAcc[n] - env.acc[n][t + 1]) 
-            self.m.addGenConstrAbs(self.slack_variables_abs[n_idx], self.slack_variables[n_idx], "absconstr")
+            self.cons_charge_graph2[n_idx] = self.m.addConstr(sum(self.flow[incoming_edges]) - sum(self.flow[outgoing_edges]) + self.slack_pos[n_idx] - self.slack_neg[n_idx] == desiredAcc[n] - env.acc[n][t + 1]) 
             
             # Constraint 3: We cannot charge more vehicles then we have charging spots
         for r_idx in range(env.number_nodes_spatial):
@@ -35,7 +45,7 @@ class RebalFlowSolver:
         
         self.obj1 = 0
         for n_idx in range(len(env.nodes)):
-            self.obj1 += self.slack_variables_abs[n_idx] * 1e10
+            self.obj1 += (self.slack_pos[n_idx] + self.slack_neg[n_idx]) * 1e10
         # self.obj1 = gp.abs_(quicksum(self.slack_variables) * 1e10)
 
         self.obj2 = 0
@@ -44,23 +54,38 @@ class RebalFlowSolver:
             self.obj2 += self.flow[e_idx] * (env.G.edges[i,j]['time'][t + 1]+env.scenario.time_normalizer) * env.scenario.operational_cost_per_timestep
         self.m.setObjective(self.obj1+self.obj2, gp.GRB.MINIMIZE)
 
+        # scalar constraint handles, in node / region order, for the batched RHS updates
+        self._charge_graph1_constrs = [_as_constr(c) for c in self.cons_charge_graph1.values()]
+        self._charge_graph2_constrs = [_as_constr(c) for c in self.cons_charge_graph2.values()]
+        self._charging_cars_constrs = [_as_constr(c) for c in self.cons_spatial_graph_charging_cars.values()]
+
     def update_constraints(self, desired_acc, env):
-        desired_acc_checksum = 0
-        acc_checksum = 0
-        for n_idx in range(len(env.nodes)):
-            node_charge = env.nodes[n_idx]
+        t = env.time + 1
+        nodes = env.nodes
+        env_acc = env.acc
+        # read the per-node accumulations once into arrays, then set each constraint family's RHS in a single call
+        acc = np.array([env_acc[n][t] for n in nodes], dtype=float)
+        desired = np.array([desired_acc[n] for n in nodes], dtype=float)
+        if __debug__:
+            # the target distribution must move exactly the available vehicles, and never ask for a negative count
+            assert abs(desired.sum() - acc.sum()) < 1e-5
+            assert (desired >= 0).all()
+        self.m.setAttr("RHS", self._charge_graph1_constrs, acc.tolist())
+        self.m.setAttr("RHS", self._charge_graph2_constrs, (desired - acc).tolist())
 
-            desired_acc_checksum += desired_acc[node_charge]
-            acc_checksum += env.acc[node_charge][env.time + 1]
-            self.cons_charge_graph1[n_idx].RHS = env.acc[node_charge][env.time + 1]
-            self.cons_charge_graph2[n_idx].RHS = desired_acc[node_charge] - env.acc[node_charge][env.time + 1]
-        assert abs(desired_acc_checksum - acc_checksum) < 1e-5
-        for r_idx in range(env.number_nodes_spatial):
-            self.cons_spatial_graph_charging_cars[r_idx].RHS = env.scenario.cars_per_station_capacity[r_idx] - env.scenario.cars_charging_per_station[r_idx][env.time+1]
+        capacity = env.scenario.cars_per_station_capacity
+        charging = env.scenario.cars_charging_per_station
+        free_spots = [capacity[r_idx] - charging[r_idx][t] for r_idx in range(env.number_nodes_spatial)]
+        self.m.setAttr("RHS", self._charging_cars_constrs, free_spots)
         self.m.update()
         
     def update_objective(self, env):
-        self.obj2 = sum((self.flow[e_idx] * (env.G.edges[env.edges[e_idx][0], env.edges[e_idx][1]]['time'][env.time + 1] + env.scenario.time_normalizer) * env.scenario.operational_cost_per_timestep) for e_idx in range(len(env.edges)))
+        t = env.time + 1
+        graph_edges = env.G.edges
+        time_normalizer = env.scenario.time_normalizer
+        cost_per_timestep = env.scenario.operational_cost_per_timestep
+        cost = np.array([(graph_edges[i, j]['time'][t] + time_normalizer) * cost_per_timestep for i, j in env.edges])
+        self.obj2 = self.flow @ cost
         self.m.setObjective(self.obj1+self.obj2, gp.GRB.MINIMIZE)
         self.m.update()
 
@@ -0,0 +1,32 @@
+import torch
+
+from src.algos.a2c_gnn import A2C
+from toy_env import make_env
+
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def _rollout(model, env, steps=4):
+    for step in range(steps):
+        env.time = step
+        torch.manual_seed(step)
+        model.select_action()
+        model.rewards.append(float(step))
+    return model.training_step()
+
+
+def test_compiled_rollout_matches_eager():
+    # every step's outputs stay alive in saved_actions until training_step, so the compiled
+    # modules must not hand back buffers that a later call overwrites
+    env = make_env(seed=1)
+    eager = A2C(env, T=4, device=DEVICE)
+    compiled = A2C(env, T=4, device=DEVICE, compile_model=True)
+    compiled.load_state_dict(eager.state_dict())
+
+    out_eager = _rollout(eager, env)
+    out_compiled = _rollout(compiled, env)
+
+    for a, b in zip(out_eager[:2], out_compiled[:2]):
+        assert torch.allclose(a, b, rtol=1e-4, atol=1e-4)
+    for (name, p), q in zip(eager.named_parameters(), compiled.parameters()):
+        assert torch.allclose(p, q, rtol=1e-4, atol=1e-5), name
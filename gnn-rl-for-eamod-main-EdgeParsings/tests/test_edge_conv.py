@@ -0,0 +1,38 @@
+import torch
+
+from src.algos.a2c_gnn import EdgeConv
+
+N_NODES, N_FEATURES, EDGE_FEATURES, HIDDEN = 9, 6, 12, 5
+
+
+def reference_edge_conv(conv, x, edge_index, edge_attr):
+    # per-edge mlp on the concatenation [x_i, x_j, edge_attr] (i the target, j the source node),
+    # mean-aggregated at the target node; nodes without incoming edges get zeros
+    out = torch.zeros(x.size(0), conv.mlp[2].out_features)
+    count = torch.zeros(x.size(0), 1)
+    for k in range(edge_index.size(1)):
+        j, i = edge_index[0, k], edge_index[1, k]
+        out[i] = out[i] + conv.mlp(torch.cat([x[i], x[j], edge_attr[k]]))
+        count[i] += 1
+    return out / count.clamp(min=1)
+
+
+def test_split_weight_edge_conv_matches_concatenation():
+    torch.manual_seed(0)
+    conv = EdgeConv(2 * N_FEATURES + EDGE_FEATURES, HIDDEN)
+    x = torch.randn(N_NODES, N_FEATURES, requires_grad=True)
+    edge_attr = torch.randn(20, EDGE_FEATURES, requires_grad=True)
+    # duplicate edges, a self loop, and the last node without incoming edges
+    edge_index = torch.randint(0, N_NODES - 1, (2, 20))
+    edge_index[:, 1] = edge_index[:, 0]
+    edge_index[:, 2] = torch.tensor([3, 3])
+
+    out = conv(x, edge_index, edge_attr)
+    expected = reference_edge_conv(conv, x, edge_index, edge_attr)
+    assert torch.allclose(out, expected, atol=1e-6)
+
+    params = [x, edge_attr] + list(conv.parameters())
+    grads = torch.autograd.grad(out.sum(), params)
+    expected_grads = torch.autograd.grad(expected.sum(), params)
+    for g, e in zip(grads, expected_grads):
+        assert torch.allclose(g, e, atol=1e-5)
@@ -0,0 +1,100 @@
+import torch
+
+from src.algos.a2c_gnn import GNNParser
+from toy_env import make_env
+
+T = 4
+CHARGE_DELTAS = (-2, -1, 0, 1, 2, 3)
+
+
+def _edge_rules(version, charge_delta, max_charge):
+    # one predicate per `if ...: edges.append([o, d])` of the original per-pair loops; a pair matching
+    # several predicates is appended several times, in this order
+    def self_loop(o, d):
+        return o[0] == d[0] and o[1] == d[1]
+
+    def grid(o, d):
+        return (o[1] == d[1] and o[0] != d[0]) or (o[1] == d[1] - 1 and o[0] == d[0]) or (o[1] == d[1] + 1 and o[0] == d[0])
+
+    def artificial(o, d):
+        return o[0] != d[0] and o[1] + (charge_delta - 1) == d[1] and d[1] != max_charge
+
+    def infeasible_charge(o, d):
+        return o[0] == d[0] and o[1] + (charge_delta + 1) == d[1]
+
+    def unintuitive_road(o, d):
+        return o[0] == d[0] and o[1] - 1 == d[1]
+
+    return {
+        1: [self_loop],
+        2: [self_loop],
+        3: [grid],
+        4: [lambda o, d: self_loop(o, d) or grid(o, d)],
+        5: [artificial, infeasible_charge, unintuitive_road, self_loop],
+        6: [artificial, infeasible_charge, unintuitive_road],
+    }[version]
+
+
+def reference_edge_index(env, version, charge_delta, max_charge):
+    if version == 0:
+        return env.gcn_edge_idx
+    pairs = []
+    for o in env.nodes:
+        for d in env.nodes:
+            for rule in _edge_rules(version, charge_delta, max_charge):
+                if rule(o, d):
+                    pairs.append([env.nodes.index(o), env.nodes.index(d)])
+    edge_index = torch.tensor(pairs, dtype=torch.long).reshape(-1, 2).T
+    if version in (2, 5, 6):
+        edge_index = torch.cat((edge_index, env.gcn_edge_idx), 1)
+    return edge_index
+
+
+def reference_edge_attr(env, edge_index):
+    # demand | price | energy distance over the next T steps for edges of the env, zeros otherwise
+    env_edges = {(tuple(o), tuple(d)) for o, d in env.edges}
+    rows = []
+    for k in range(edge_index.shape[1]):
+        o, d = env.nodes[edge_index[0, k]], env.nodes[edge_index[1, k]]
+        if (o, d) in env_edges:
+            i, j = o[0], d[0]
+            ts = range(env.time + 1, env.time + T + 1)
+            rows.append([env.demand[i, j][t] for t in ts] + [env.price[i, j][t] for t in ts]
+                        + [env.scenario.energy_distance[i, j]] * T)
+        else:
+            rows.append([0] * (3 * T))
+    return torch.tensor(rows, dtype=torch.float64).float()
+
+
+def test_edge_index_matches_reference_loops():
+    for seed in range(3):
+        env = make_env(seed=seed, time=seed + 1)
+        max_charge = env.scenario.number_charge_levels
+        parser = GNNParser(env, T=T)
+        for version in range(7):
+            for charge_delta in CHARGE_DELTAS:
+                # twice, the second call is served from the edge_index cache
+                for _ in range(2):
+                    edge_index = parser.parse_obs(version, charge_delta, max_charge).edge_index
+                    expected = reference_edge_index(env, version, charge_delta, max_charge)
+                    assert edge_index.dtype == torch.long
+                    assert torch.equal(edge_index, expected), (seed, version, charge_delta)
+
+
+def test_duplicate_edges_are_kept():
+    # with charge_delta=-2 the "infeasible" charge edges coincide with the "unintuitive" road edges
+    env = make_env(seed=0)
+    edge_index = GNNParser(env, T=T).parse_obs(6, -2, env.scenario.number_charge_levels).edge_index
+    pairs = edge_index.T.tolist()
+    assert len(pairs) > len({tuple(p) for p in pairs})
+
+
+def test_edge_attr_follows_edge_index():
+    for seed in range(2):
+        env = make_env(seed=seed, time=seed + 1)
+        parser = GNNParser(env, T=T, MPNN=True)
+        for version in range(7):
+            data = parser.parse_obs(version, 2, env.scenario.number_charge_levels, MPNN=True)
+            expected = reference_edge_attr(env, data.edge_index)
+            assert data.edge_attr.dtype == torch.float32
+            assert torch.allclose(data.edge_attr, expected), (seed, version)
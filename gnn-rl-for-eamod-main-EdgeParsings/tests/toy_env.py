@@ -0,0 +1,49 @@
+"""
+Small synthetic stand-in for the AMoD environment, exposing only the attributes read by GNNParser and A2C.
+"""
+import random
+from collections import defaultdict
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+
+def make_env(n_regions=3, n_charge_levels=6, horizon=30, seed=0, time=0):
+    rng = random.Random(seed)
+    nodes = [(r, c) for r in range(n_regions) for c in range(n_charge_levels + 1)]
+    region = list(range(n_regions))
+
+    acc = defaultdict(dict)
+    dacc = defaultdict(dict)
+    for n in nodes:
+        for t in range(horizon):
+            acc[n][t] = rng.randint(0, 9)
+            dacc[n][t] = rng.randint(0, 4)
+    price = defaultdict(dict)
+    demand = defaultdict(dict)
+    for i in region:
+        for j in region:
+            for t in range(horizon):
+                price[i, j][t] = rng.random() * 30
+                demand[i, j][t] = rng.randint(0, 12)
+
+    energy_distance = np.array([[0 if i == j else rng.randint(1, 3) for j in region] for i in region])
+    charging_stations = [rng.random() < 0.5 for _ in region]
+    scenario = SimpleNamespace(number_charge_levels=n_charge_levels, energy_distance=energy_distance,
+                               charging_stations=charging_stations, charge_levels_per_charge_step=2)
+
+    # road edges drop the charge by the energy distance, charging edges stay in the region
+    edges = []
+    for o in nodes:
+        for d in nodes:
+            if o[0] != d[0] and d[1] == o[1] - energy_distance[o[0], d[0]] and d[1] >= 0:
+                edges.append((o, d))
+            if o[0] == d[0] and d[1] == min(o[1] + 2, n_charge_levels) and o[1] != n_charge_levels and charging_stations[o[0]]:
+                edges.append((o, d))
+    node_idx = {n: i for i, n in enumerate(nodes)}
+    gcn_edge_idx = torch.tensor([[node_idx[o] for o, d in edges], [node_idx[d] for o, d in edges]], dtype=torch.long)
+
+    return SimpleNamespace(nodes=nodes, region=region, acc=acc, dacc=dacc, price=price, demand=demand,
+                           scenario=scenario, edges=edges, gcn_edge_idx=gcn_edge_idx, number_nodes=len(nodes),
+                           time=time)